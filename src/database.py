@@ -1,10 +1,11 @@
 """Simplified database module - tracks processed files only."""
 
+import json
 import sqlite3
 import logging
 from pathlib import Path
 from contextlib import contextmanager
-from typing import List
+from typing import List, Set
 
 
 class ProgressDatabase:
@@ -13,20 +14,29 @@ class ProgressDatabase:
     def __init__(self, db_path: str, logger=None):
         self.db_path = Path(db_path)
         self.logger = logger or logging.getLogger(__name__)
+        # Single long-lived connection; transactions are managed explicitly
+        self.conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(
+            "PRAGMA journal_mode=WAL; "
+            "PRAGMA synchronous=NORMAL; "
+            "PRAGMA temp_store=MEMORY; "
+            "PRAGMA cache_size=-64000; "
+            "PRAGMA busy_timeout=5000;"
+        )
         self._init_database()
+        # Row count maintained in memory; this class is the only writer
+        self._count = self.conn.execute("SELECT COUNT(*) FROM processed_files").fetchone()[0]
     
     @contextmanager
-    def _get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
         try:
-            yield conn
-            conn.commit()
+            yield self.conn
+            self.conn.execute("COMMIT")
         except Exception:
-            conn.rollback()
+            self.conn.execute("ROLLBACK")
             raise
-        finally:
-            conn.close()
     
     def _init_database(self) -> None:
         schema = """
@@ -35,70 +45,67 @@ class ProgressDatabase:
                 relative_path TEXT UNIQUE NOT NULL,
                 processed_at REAL DEFAULT (unixepoch())
             );
-            CREATE INDEX IF NOT EXISTS idx_path ON processed_files(relative_path);
+            -- The UNIQUE constraint already indexes relative_path
+            DROP INDEX IF EXISTS idx_path;
         """
-        with self._get_connection() as conn:
-            conn.executescript(schema)
+        self.conn.executescript(schema)
         self.logger.info(f"Database initialized at {self.db_path}")
     
     def is_processed(self, relative_path: str) -> bool:
         """Check if file has been processed."""
-        with self._get_connection() as conn:
-            cursor = conn.execute(
-                "SELECT 1 FROM processed_files WHERE relative_path = ?",
-                (relative_path,)
-            )
-            return cursor.fetchone() is not None
+        cursor = self.conn.execute(
+            "SELECT 1 FROM processed_files WHERE relative_path = ?",
+            (relative_path,)
+        )
+        return cursor.fetchone() is not None
+    
+    def load_processed_set(self) -> Set[str]:
+        """Load all processed paths for bulk membership checks."""
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("SELECT relative_path FROM processed_files")
+        return {path for path, in cursor}
     
     def add_processed(self, paths: List[str]) -> None:
         """Add records of successfully processed files."""
-        with self._get_connection() as conn:
-            conn.executemany(
-                "INSERT OR REPLACE INTO processed_files (relative_path) VALUES (?)",
-                [(p,) for p in paths]
+        with self._transaction() as conn:
+            cursor = conn.executemany(
+                "INSERT INTO processed_files (relative_path) VALUES (?) "
+                "ON CONFLICT(relative_path) DO NOTHING",
+                ((p,) for p in paths)
             )
+        self._count += cursor.rowcount
         self.logger.info(f"Recorded {len(paths)} processed files")
     
     def get_count(self) -> int:
         """Get total count of processed files."""
-        with self._get_connection() as conn:
-            cursor = conn.execute("SELECT COUNT(*) as count FROM processed_files")
-            return cursor.fetchone()['count']
+        return self._count
 
-    def get_old_records(self, days: int) -> list:
-        """Get records older than specified days.
+    def get_old_records(self, cutoff: float) -> List[str]:
+        """Get relative paths of records processed before cutoff (a Unix timestamp)."""
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(
+            "SELECT relative_path FROM processed_files WHERE processed_at < ?",
+            (cutoff,)
+        )
+        return [path for path, in cursor]
 
-        Returns list of (relative_path, processed_at) tuples.
-        """
-        with self._get_connection() as conn:
-            cursor = conn.execute(
-                "SELECT relative_path, processed_at FROM processed_files "
-                "WHERE processed_at < (unixepoch() - ?)",
-                (days * 86400,)
-            )
-            return [(row['relative_path'], row['processed_at']) for row in cursor.fetchall()]
-
-    def remove_records(self, paths: List[str]) -> int:
-        """Remove records by relative paths.
+    def delete_old_records(self, cutoff: float, keep: List[str]) -> int:
+        """Delete records processed before cutoff, except the paths in keep.
 
         Returns number of records deleted.
         """
-        if not paths:
-            return 0
-
-        with self._get_connection() as conn:
-            # SQLite has a limit on number of parameters, process in chunks
-            chunk_size = 900  # Safe limit below SQLite's default 999
-            total_deleted = 0
-
-            for i in range(0, len(paths), chunk_size):
-                chunk = paths[i:i + chunk_size]
-                placeholders = ','.join('?' * len(chunk))
-                cursor = conn.execute(
-                    f"DELETE FROM processed_files WHERE relative_path IN ({placeholders})",
-                    chunk
-                )
-                total_deleted += cursor.rowcount
+        # keep goes in as one JSON parameter, so its size isn't bound by
+        # SQLite's host parameter limit
+        cursor = self.conn.execute(
+            "DELETE FROM processed_files WHERE processed_at < ? "
+            "AND relative_path NOT IN (SELECT value FROM json_each(?))",
+            (cutoff, json.dumps(keep))
+        )
+        self._count -= cursor.rowcount
+        return cursor.rowcount
 
-        self.logger.info(f"Removed {total_deleted} old records from database")
-        return total_deleted
+    def close(self) -> None:
+        """Close the database connection."""
+        self.conn.close()
@@ -102,29 +102,30 @@ def run_processor(config, logger) -> None:
         logger=logger
     )
 
-    processor = PhotoProcessor(
-        source_dir=config['source_dir'],
-        target_dir=config['target_dir'],
-        db=db,
-        motionphoto2_path=config['motionphoto2_path'],
-        scan_days=config['scan_days'],
-        target_retention_days=config['target_retention_days'],
-        logger=logger
-    )
+    try:
+        processor = PhotoProcessor(
+            source_dir=config['source_dir'],
+            target_dir=config['target_dir'],
+            db=db,
+            motionphoto2_path=config['motionphoto2_path'],
+            scan_days=config['scan_days'],
+            target_retention_days=config['target_retention_days'],
+            logger=logger
+        )
 
-    files_to_process = processor.scan_source_directory()
+        processed_count = processor.process_files(processor.iter_source_files())
 
-    if not files_to_process:
-        logger.info("No new or modified files to process")
-    else:
-        logger.info(f"Processing {len(files_to_process)} files...")
-        processed_count = processor.process_files(files_to_process)
-        logger.info(f"Processing complete: {processed_count} files")
+        if not processed_count:
+            logger.info("No new or modified files to process")
+        else:
+            logger.info(f"Processing complete: {processed_count} files")
 
-    logger.info(f"Total processed files in DB: {db.get_count()}")
-    logger.info("=" * 60)
-    logger.info("Run complete")
-    logger.info("=" * 60)
+        logger.info(f"Total processed files in DB: {db.get_count()}")
+        logger.info("=" * 60)
+        logger.info("Run complete")
+        logger.info("=" * 60)
+    finally:
+        db.close()
 
 
 if __name__ == '__main__':
@@ -1,13 +1,40 @@
 """Simplified file processor - crashes on any error."""
 
 import os
+import errno
 import time
 import shutil
+import signal
 import subprocess
+import tempfile
+import threading
 import logging
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+def _split_stem_ext(path: str) -> Tuple[str, str]:
+    """Split a path into (stem, suffix) like Path.stem/Path.suffix, without a Path object."""
+    i = path.rfind(os.sep)
+    j = path.rfind('.')
+    if i + 1 < j < len(path) - 1:
+        return path[i + 1:j], path[j:]
+    return path[i + 1:], ''
+
+
+def _kill_process_group(proc: subprocess.Popen) -> None:
+    """SIGKILL a process started with start_new_session=True, and its children."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+# File kinds for Live Photo pair detection
+KIND_PHOTO, KIND_VIDEO, KIND_OTHER = 0, 1, 2
+LIVE_PHOTO_KINDS = frozenset({(KIND_PHOTO, KIND_VIDEO), (KIND_VIDEO, KIND_PHOTO)})
 
 
 class PhotoProcessor:
@@ -15,6 +42,25 @@ class PhotoProcessor:
 
     BATCH_SIZE = 100
     MOTIONPHOTO2_TIMEOUT = 3600
+    MOTIONPHOTO2_OUTPUT_TAIL = 200  # Lines of output kept for error messages
+    SCAN_WORKERS = 16
+    LINK_WORKERS = 8
+    PAIRING_WINDOW = 1000  # Basenames held back waiting for a Live Photo partner
+
+    # Common picture and video extensions
+    PHOTO_EXTENSIONS = frozenset({
+        '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.heic', '.heif'
+    })
+    VIDEO_EXTENSIONS = frozenset({
+        '.mp4', '.mov', '.avi', '.mkv', '.flv', '.wmv', '.m4v', '.3gp', '.webm', '.mts', '.m2ts'
+    })
+    MEDIA_EXTENSIONS = PHOTO_EXTENSIONS | VIDEO_EXTENSIONS
+
+    # Extension -> kind lookup for Live Photo detection
+    EXTENSION_KINDS = {
+        **dict.fromkeys(PHOTO_EXTENSIONS, KIND_PHOTO),
+        **dict.fromkeys(VIDEO_EXTENSIONS, KIND_VIDEO),
+    }
 
     def __init__(
         self,
@@ -27,12 +73,19 @@ class PhotoProcessor:
         logger=None
     ):
         self.source_dir = Path(source_dir).resolve()
+        # Walked paths are always under source_dir, so stripping this prefix
+        # gives the relative path without os.path.relpath
+        self._source_prefix = str(self.source_dir).rstrip(os.sep) + os.sep
         self.target_dir = Path(target_dir).resolve()
         self.db = db
         self.motionphoto2_path = motionphoto2_path
         self.scan_days = scan_days
         self.target_retention_days = target_retention_days
         self.logger = logger or logging.getLogger(__name__)
+        # The running motionphoto2, so the main thread can kill it on Ctrl-C
+        self._motionphoto2_proc: Optional[subprocess.Popen] = None
+        self._motionphoto2_cancelled = False
+        self._motionphoto2_lock = threading.Lock()
 
         if not os.path.isfile(self.motionphoto2_path):
             raise FileNotFoundError(f"motionphoto2 binary not found: {self.motionphoto2_path}")
@@ -44,81 +97,96 @@ class PhotoProcessor:
             f"target_retention_days={target_retention_days}"
         )
 
-    def scan_source_directory(self) -> List[Tuple[str, str]]:
-        """Scan for files and return (relative_path, full_path) for unprocessed files."""
+    def _scan_dir(self, path: str, cutoff: float) -> Tuple[List[str], List[str]]:
+        """List one directory, returning (media file paths modified after cutoff, subdirs)."""
+        files = []
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = entry.name
+                    i = name.rfind('.')
+                    if i < 0 or name[i:].lower() not in self.MEDIA_EXTENSIONS:
+                        continue
+                    if cutoff and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        continue
+                    files.append(entry.path)
+        return files, subdirs
+
+    def iter_source_files(self) -> Iterator[Tuple[str, str]]:
+        """Yield (relative_path, full_path) for unprocessed files as directories are scanned."""
         self.logger.info(f"Starting scan of {self.source_dir}")
 
-        files_to_process = []
-
-        # Common picture and video extensions
-        extensions = [
-            'jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'tif', 'webp', 'heic', 'heif',
-            'mp4', 'mov', 'avi', 'mkv', 'flv', 'wmv', 'm4v', '3gp', 'webm', 'mts', 'm2ts'
-        ]
-
-        # Build find command with extension filters
-        # If scan_days is 0 or less, scan the whole library (no -mtime filter)
-        find_cmd = [
-            'find', str(self.source_dir),
-            '-type', 'f',
-        ]
-        if self.scan_days > 0:
-            find_cmd.extend(['-mtime', f'-{self.scan_days}'])
-
-        # Add extension filters (case insensitive)
-        ext_filters = []
-        for ext in extensions:
-            if not ext_filters:
-                ext_filters.extend(['(', '-iname', f'*.{ext}'])
-            else:
-                ext_filters.extend(['-o', '-iname', f'*.{ext}'])
-        ext_filters.append(')')
-
-        find_cmd.extend(ext_filters)
-        find_cmd.append('-print0')
+        file_count = 0
 
-        result = subprocess.run(
-            find_cmd,
-            capture_output=True,
-            text=False,
-            timeout=300
-        )
+        # If scan_days is 0 or less, scan the whole library (no mtime filter)
+        cutoff = time.time() - self.scan_days * 86400 if self.scan_days > 0 else 0
 
-        if result.returncode != 0:
-            error_msg = result.stderr.decode('utf-8', errors='ignore') if result.stderr else "Unknown error"
-            raise RuntimeError(f"find command failed: {error_msg}")
+        processed = self.db.load_processed_set()
+        source_prefix = self._source_prefix
 
-        if result.stdout:
-            file_paths = [path.decode("utf-8") for path in result.stdout.split(b'\x00')]
-            for filepath in file_paths:
-                if not filepath:
-                    continue
-                try:
-                    relative_path = os.path.relpath(filepath, self.source_dir)
-                except ValueError:
-                    continue
+        # Directories are listed in parallel so that slow (network) storage
+        # has many directory reads in flight at once. Results are consumed in
+        # submission order (breadth-first, sorted), so the stream is
+        # deterministic regardless of which listing finishes first.
+        with ThreadPoolExecutor(max_workers=self.SCAN_WORKERS) as executor:
+            pending = deque([executor.submit(self._scan_dir, str(self.source_dir), cutoff)])
+            while pending:
+                filepaths, subdirs = pending.popleft().result()
+                for subdir in sorted(subdirs):
+                    pending.append(executor.submit(self._scan_dir, subdir, cutoff))
 
-                if not self.db.is_processed(relative_path):
-                    files_to_process.append((relative_path, filepath))
+                for filepath in sorted(filepaths):
+                    if not filepath.startswith(source_prefix):
+                        continue
+                    relative_path = filepath[len(source_prefix):]
+                    if relative_path not in processed:
+                        file_count += 1
+                        yield relative_path, filepath
 
-        self.logger.info(f"Scan complete: {len(files_to_process)} files to process")
-        return files_to_process
+        self.logger.info(f"Scan complete: {file_count} files to process")
 
-    def create_temp_symlinks(self, files: List[Tuple[str, str]]) -> str:
-        """Create temporary directory with symlinks."""
-        timestamp = int(time.time())
-        temp_dir = f"/tmp/gp_processor_{timestamp}"
-        os.makedirs(temp_dir, exist_ok=True)
+    def _link_file(self, full_path: str, temp_link: str) -> bool:
+        """Hardlink full_path to temp_link, falling back to a symlink.
 
-        for relative_path, full_path in files:
-            temp_subdir = os.path.join(temp_dir, os.path.dirname(relative_path))
-            os.makedirs(temp_subdir, exist_ok=True)
+        Returns True if a symlink was created.
+        """
+        try:
+            os.link(full_path, temp_link)
+            return False
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EROFS):
+                raise
+        os.symlink(full_path, temp_link)
+        return True
 
-            temp_link = os.path.join(temp_dir, relative_path)
-            os.symlink(full_path, temp_link)
-            self.logger.debug(f"Created symlink: {full_path} -> {temp_link}")
+    def create_temp_links(self, files: List[Tuple[str, str]]) -> str:
+        """Create temporary directory with links to the source files.
 
-        self.logger.debug(f"Created temp directory with {len(files)} symlinks: {temp_dir}")
+        Hardlinks are used where possible; symlinks are the fallback when the
+        source lives on another filesystem or cannot be hardlinked.
+        """
+        temp_dir = tempfile.mkdtemp(prefix="gp_processor_")
+
+        # Create each needed subdirectory once rather than once per file
+        parents = {os.path.dirname(relative_path) for relative_path, _ in files}
+        parents.discard('')  # temp_dir itself already exists
+        for parent in parents:
+            os.makedirs(os.path.join(temp_dir, parent), exist_ok=True)
+
+        # Link syscalls release the GIL, so they can overlap across threads
+        with ThreadPoolExecutor(max_workers=self.LINK_WORKERS) as executor:
+            symlink_count = sum(executor.map(
+                lambda file: self._link_file(file[1], os.path.join(temp_dir, file[0])),
+                files
+            ))
+
+        self.logger.debug(
+            f"Created temp directory with {len(files) - symlink_count} hardlinks "
+            f"and {symlink_count} symlinks: {temp_dir}"
+        )
         return temp_dir
 
     def run_motionphoto2(self, temp_dir: str) -> str:
@@ -133,21 +201,58 @@ class PhotoProcessor:
 
         self.logger.info(f"Running: {' '.join(cmd)}")
 
-        result = subprocess.run(
+        # Stream output to the debug log instead of buffering all of it; only
+        # the tail is kept for the error message
+        tail = deque(maxlen=self.MOTIONPHOTO2_OUTPUT_TAIL)
+        # motionphoto2 gets its own process group so that on timeout its
+        # children (exiftool, ffmpeg), which hold the output pipe, die with it
+        with subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            timeout=self.MOTIONPHOTO2_TIMEOUT
-        )
-
-        output = result.stdout + result.stderr
-
-        if result.returncode != 0:
-            raise RuntimeError(f"motionphoto2 failed with code {result.returncode}: {output}")
+            start_new_session=True
+        ) as proc:
+            with self._motionphoto2_lock:
+                self._motionphoto2_proc = proc
+                if self._motionphoto2_cancelled:
+                    _kill_process_group(proc)
+
+            deadline = time.monotonic() + self.MOTIONPHOTO2_TIMEOUT
+            timer = threading.Timer(self.MOTIONPHOTO2_TIMEOUT, _kill_process_group, (proc,))
+            timer.start()
+            try:
+                for line in proc.stdout:
+                    line = line.rstrip()
+                    tail.append(line)
+                    self.logger.debug(line)
+                returncode = proc.wait()
+            except BaseException:
+                # Not in our process group, so it won't get e.g. Ctrl-C itself
+                _kill_process_group(proc)
+                raise
+            finally:
+                timer.cancel()
+                with self._motionphoto2_lock:
+                    self._motionphoto2_proc = None
+
+        output = '\n'.join(tail)
+
+        if returncode != 0 and time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired(cmd, self.MOTIONPHOTO2_TIMEOUT, output=output)
+        if returncode != 0:
+            raise RuntimeError(f"motionphoto2 failed with code {returncode}: {output}")
 
         self.logger.info(f"motionphoto2 completed")
         return output
 
+    def cancel_motionphoto2(self) -> None:
+        """Kill the running motionphoto2, and any started after this call."""
+        with self._motionphoto2_lock:
+            self._motionphoto2_cancelled = True
+            if self._motionphoto2_proc is not None:
+                _kill_process_group(self._motionphoto2_proc)
+
     def cleanup_temp_dir(self, temp_dir: str) -> None:
         """Remove temporary directory."""
         try:
@@ -161,102 +266,131 @@ class PhotoProcessor:
         target_path = self.target_dir / relative_path
         target_path.parent.mkdir(parents=True, exist_ok=True)
         shutil.copy2(full_path, target_path)
-        self.logger.info(f"Copied: {relative_path}")
-
-    def process_files(self, files: List[Tuple[str, str]]) -> int:
-        """Process files - Live Photo pairs via motionphoto2, non-Live Photos via direct copy."""
-        if not files:
-            return 0
+        self.logger.debug(f"Copied: {relative_path}")
 
-        # Photo extensions and video extensions for Live Photo detection
-        photo_exts = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.heic', '.heif'}
-        video_exts = {'.mp4', '.mov', '.avi', '.mkv', '.flv', '.wmv', '.m4v', '.3gp', '.webm', '.mts', '.m2ts'}
+    def _iter_basename_groups(
+        self, files: Iterable[Tuple[str, str]]
+    ) -> Iterator[Tuple[Tuple[str, str, int], ...]]:
+        """Group streamed files by basename (filename without extension).
 
-        # Group files by basename (filename without extension)
-        basename_groups = defaultdict(list)
+        Yields tuples of (relative_path, full_path, kind). A group is yielded once
+        PAIRING_WINDOW newer basenames have been seen, or at the end of the stream.
+        """
+        # Groups are tuples rather than lists: most basenames are singletons, and
+        # this avoids allocating (and over-allocating) a list for each of them
+        pending = {}  # basename -> group, oldest basename first
         for relative_path, full_path in files:
-            # Get basename without extension
-            path_obj = Path(relative_path)
-            basename = path_obj.stem.lower()  # e.g., "IMG_9647" from "IMG_9647.HEIC"
-            ext = path_obj.suffix.lower()
-            basename_groups[basename].append((relative_path, full_path, ext))
-
-        # Identify Live Photo pairs and non-Live Photo files
-        pairs = []  # List of (photo_path, video_path) tuples
-        non_live_photos = []  # List of (relative_path, full_path) for unpaired files
-
-        for basename, group in basename_groups.items():
-            if len(group) == 2:
-                # Check if it's a photo+video pair
-                ext1, ext2 = group[0][2], group[1][2]
-                is_pair = (ext1 in photo_exts and ext2 in video_exts) or (ext1 in video_exts and ext2 in photo_exts)
-                if is_pair:
-                    # Sort so photo comes first
-                    if ext1 in video_exts:
-                        group[0], group[1] = group[1], group[0]
-                    pairs.append(((group[0][0], group[0][1]), (group[1][0], group[1][1])))
-                else:
-                    # Same type, treat as non-Live Photos
-                    for item in group:
-                        non_live_photos.append((item[0], item[1]))
-            else:
-                # Non-Live Photo file or more than 2 files with same basename
-                for item in group:
-                    non_live_photos.append((item[0], item[1]))
+            basename, ext = _split_stem_ext(relative_path)  # e.g., "IMG_9647", ".HEIC"
+            basename = basename.lower()
+            entry = (relative_path, full_path, self.EXTENSION_KINDS.get(ext.lower(), KIND_OTHER))
+            group = pending.get(basename)
+            pending[basename] = (entry,) if group is None else group + (entry,)
+            if len(pending) > self.PAIRING_WINDOW:
+                yield pending.pop(next(iter(pending)))
 
-        self.logger.info(f"Found {len(pairs)} Live Photo pairs and {len(non_live_photos)} non-Live Photos")
-
-        processed_count = 0
-
-        # Process non-Live Photos via direct Python copy
-        if non_live_photos:
-            self.logger.info(f"Copying {len(non_live_photos)} non-Live Photos directly...")
-            for relative_path, full_path in non_live_photos:
-                try:
-                    self.copy_non_live_photo(relative_path, full_path)
-                    self.db.add_processed([relative_path])
-                    processed_count += 1
-                except Exception as e:
-                    raise RuntimeError(f"Failed to copy non-Live Photo {relative_path}: {e}")
-            self.logger.info(f"Non-Live Photo copy complete")
-
-        # Create batches of Live Photo pairs for motionphoto2
-        batches = []
-        current_batch = []
+        yield from pending.values()
 
-        for photo, video in pairs:
-            if len(current_batch) >= self.BATCH_SIZE:
-                batches.append(current_batch)
-                current_batch = []
-            current_batch.extend([photo, video])
+    def _process_batch(self, batch: List[Tuple[str, str]], batch_num: int) -> List[str]:
+        """Run motionphoto2 on a batch of Live Photo files, returning their relative paths."""
+        self.logger.info(f"Processing batch {batch_num} ({len(batch)} Live Photo files)")
 
-        if current_batch:
-            batches.append(current_batch)
+        temp_dir = self.create_temp_links(batch)
+        try:
+            self.run_motionphoto2(temp_dir)
+        finally:
+            self.cleanup_temp_dir(temp_dir)
 
-        # Process Live Photo pair batches via motionphoto2
-        if batches:
-            total_batches = len(batches)
-            for batch_num, batch in enumerate(batches):
-                self.logger.info(f"Processing batch {batch_num + 1}/{total_batches} ({len(batch)} Live Photo files)")
+        batch_paths = []
+        for relative_path, _ in batch:
+            batch_paths.append(relative_path)
+            self.logger.debug(f"Processed Live Photo: {relative_path}")
 
-                temp_dir = self.create_temp_symlinks(batch)
-                batch_paths = []
-                try:
-                    self.run_motionphoto2(temp_dir)
+        self.logger.info(f"Batch {batch_num} complete: {len(batch)} Live Photo files")
+        return batch_paths
 
-                    for relative_path, _ in batch:
-                        batch_paths.append(relative_path)
-                        self.logger.info(f"Processed Live Photo: {relative_path}")
+    def _record_batch(self, future: Optional[Future]) -> int:
+        """Wait for an in-flight batch and record its progress."""
+        if future is None:
+            return 0
+        batch_paths = future.result()
+        if batch_paths:
+            self.db.add_processed(batch_paths)
+        return len(batch_paths)
 
-                    processed_count += len(batch)
-                    self.logger.info(f"Batch {batch_num + 1} complete")
+    def process_files(self, files: Iterable[Tuple[str, str]]) -> int:
+        """Process files - Live Photo pairs via motionphoto2, non-Live Photos via direct copy.
 
-                finally:
-                    self.cleanup_temp_dir(temp_dir)
+        Files are consumed as a stream. Each full batch of Live Photo pairs is run
+        through motionphoto2 in the background while the next batch is assembled.
+        """
+        processed_count = 0
+        pair_count = 0
+        non_live_count = 0
+        batch_num = 0
+        current_batch = []
+        in_flight = None
+
+        # A single worker: motionphoto2 runs one batch at a time, overlapping
+        # with scanning, copying and batch assembly on this thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            try:
+                for group in self._iter_basename_groups(files):
+                    if len(group) == 2:
+                        # Check if it's a photo+video pair, with the photo first
+                        first, second = group
+                        kinds = (first[2], second[2])
+                        if kinds in LIVE_PHOTO_KINDS:
+                            if kinds == (KIND_VIDEO, KIND_PHOTO):
+                                first, second = second, first
+                            pair_count += 1
+                            current_batch.extend([first[:2], second[:2]])
+                            if len(current_batch) >= self.BATCH_SIZE:
+                                previous, in_flight = in_flight, None
+                                processed_count += self._record_batch(previous)
+                                batch_num += 1
+                                in_flight = executor.submit(self._process_batch, current_batch, batch_num)
+                                current_batch = []
+                            continue
+
+                    # Non-Live Photo file, same-type files, or more than 2 files with same basename
+                    # are copied directly
+                    for relative_path, full_path, _ in group:
+                        try:
+                            self.copy_non_live_photo(relative_path, full_path)
+                            self.db.add_processed([relative_path])
+                            processed_count += 1
+                            non_live_count += 1
+                        except Exception as e:
+                            raise RuntimeError(f"Failed to copy non-Live Photo {relative_path}: {e}")
+
+                if current_batch:
+                    previous, in_flight = in_flight, None
+                    processed_count += self._record_batch(previous)
+                    batch_num += 1
+                    in_flight = executor.submit(self._process_batch, current_batch, batch_num)
+                previous, in_flight = in_flight, None
+                processed_count += self._record_batch(previous)
+            except KeyboardInterrupt:
+                # Ctrl-C only reaches this thread, and motionphoto2 runs in its
+                # own session; kill it rather than wait for the batch to finish
+                self.cancel_motionphoto2()
+                # The killed batch fails; don't let that hide the interrupt
+                if in_flight is not None and in_flight.exception() is not None:
+                    in_flight = None
+                raise
+            finally:
+                # Record batch progress immediately, even if the loop above failed;
+                # a failure of the batch itself is raised from here
+                previous, in_flight = in_flight, None
+                processed_count += self._record_batch(previous)
+
+        if not processed_count:
+            return 0
 
-                # Record batch progress immediately
-                if batch_paths:
-                    self.db.add_processed(batch_paths)
+        self.logger.info(
+            f"Processed {pair_count} Live Photo pairs in {batch_num} batches "
+            f"and copied {non_live_count} non-Live Photos"
+        )
 
         # Clean up old target files
         self.cleanup_old_targets()
@@ -279,18 +413,20 @@ class PhotoProcessor:
             f"Cleaning up targets older than {self.target_retention_days} days"
         )
 
-        old_records = self.db.get_old_records(self.target_retention_days)
+        # One cutoff for both queries, so a record can't age past it in between
+        cutoff = time.time() - self.target_retention_days * 86400
+        old_records = self.db.get_old_records(cutoff)
         if not old_records:
             self.logger.info("No old records to clean up")
             return 0
 
         self.logger.info(f"Found {len(old_records)} old records to clean up")
 
-        cleaned_paths = []
         deleted_count = 0
         skipped_count = 0
+        failed_paths = []
 
-        for relative_path, processed_at in old_records:
+        for relative_path in old_records:
             target_path = self.target_dir / relative_path
 
             if target_path.exists():
@@ -302,7 +438,8 @@ class PhotoProcessor:
                     self.logger.warning(
                         f"Failed to delete {target_path}: {e}"
                     )
-                    continue
+                    # Keep the record so the next run tries again
+                    failed_paths.append(relative_path)
             else:
                 # Target doesn't exist - this is expected for Live Photo video files
                 # (MOV files get merged into the photo file)
@@ -311,16 +448,11 @@ class PhotoProcessor:
                 )
                 skipped_count += 1
 
-            cleaned_paths.append(relative_path)
-
-        # Remove records from database
-        if cleaned_paths:
-            self.db.remove_records(cleaned_paths)
-
+        removed_count = self.db.delete_old_records(cutoff, failed_paths)
         self.logger.info(
             f"Cleanup complete: {deleted_count} files deleted, "
             f"{skipped_count} skipped (not found), "
-            f"{len(cleaned_paths)} records removed from DB"
+            f"{removed_count} records removed from DB"
         )
 
-        return len(cleaned_paths)
+        return removed_count
@@ -1,15 +1,20 @@
 """Scheduler module for daily execution."""
 
-import time
+import asyncio
+import inspect
 import logging
+import threading
+import time
 from typing import Callable, Optional
-from datetime import datetime
-
-import schedule
+from datetime import datetime, timedelta
 
 
 class DailyScheduler:
-    """Manages daily scheduled execution using the schedule library."""
+    """Manages daily scheduled execution at a fixed time of day."""
+    
+    # Timers count monotonic time, which does not advance during suspend and
+    # ignores wall-clock steps; re-check the wall clock at least this often
+    CLOCK_CHECK_INTERVAL = 3600
     
     def __init__(
         self,
@@ -22,39 +27,143 @@ class DailyScheduler:
         
         Args:
             schedule_time: Time to run daily (format: "HH:MM", 24-hour)
-            job_func: Function to call at scheduled time
+            job_func: Function to call at scheduled time; may be a coroutine function
             logger: Logger instance
         """
         self.schedule_time = schedule_time
         self.job_func = job_func
         self.logger = logger or logging.getLogger(__name__)
-        self._stop_flag = False
+        self._is_coro = inspect.iscoroutinefunction(job_func)
+        self._stop_event = threading.Event()
+        # Set by the timer (or stop()) to wake the thread blocked in start()
+        self._wake = threading.Event()
+        self._timer: Optional[threading.Timer] = None
+        # Makes "check stop, then arm" atomic with respect to stop()
+        self._timer_lock = threading.Lock()
+        # Set by start_async() so stop() can wake the event loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_stop: Optional[asyncio.Event] = None
         
-        # Validate and parse time
+        # Validate and parse time once
         try:
-            datetime.strptime(schedule_time, "%H:%M")
+            self._time_of_day = datetime.strptime(schedule_time, "%H:%M").time()
         except ValueError:
             raise ValueError(f"Invalid schedule_time format: {schedule_time}. Expected HH:MM (24-hour format)")
         
         # Schedule the job
-        schedule.every().day.at(schedule_time).do(self._run_job)
+        self._next_run = self._compute_next(datetime.now())
         
-        self.logger.info(f"Scheduled daily job at {schedule_time}")
+        self.logger.info("Scheduled daily job at %s", schedule_time)
+    
+    def _compute_next(self, now: datetime) -> datetime:
+        """Return the first scheduled time strictly after now."""
+        next_run = datetime.combine(now.date(), self._time_of_day)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return next_run
     
     def _run_job(self):
-        """Wrapper to run the job."""
+        """Wrapper to run the job; a failure is logged and doesn't stop the scheduler."""
         self.logger.info("Starting scheduled job execution")
-        self.job_func()
-        self.logger.info("Scheduled job completed successfully")
+        t0 = time.monotonic()
+        try:
+            result = self.job_func()
+            if self._is_coro:
+                asyncio.run(result)
+        except Exception:
+            self.logger.exception("Scheduled job failed")
+        else:
+            self.logger.info("Scheduled job completed in %.2fs", time.monotonic() - t0)
+    
+    async def _run_job_async(self):
+        """Wrapper to run the job without blocking the event loop."""
+        self.logger.info("Starting scheduled job execution")
+        t0 = time.monotonic()
+        try:
+            if self._is_coro:
+                await self.job_func()
+            else:
+                await asyncio.get_running_loop().run_in_executor(None, self.job_func)
+        except Exception:
+            self.logger.exception("Scheduled job failed")
+        else:
+            self.logger.info("Scheduled job completed in %.2fs", time.monotonic() - t0)
+    
+    def _arm(self) -> None:
+        """Arm a one-shot timer for the next scheduled run (or the next clock check)."""
+        delay = (self._next_run - datetime.now()).total_seconds()
+        delay = min(max(delay, 0), self.CLOCK_CHECK_INTERVAL)
+        with self._timer_lock:
+            if self._stop_event.is_set():
+                return
+            self._timer = threading.Timer(delay, self._fire)
+            self._timer.start()
+    
+    def _cancel_timer(self) -> None:
+        """Cancel the pending timer; _arm() won't start a new one once stopped."""
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+    
+    def _fire(self) -> None:
+        """Timer callback: wake start(), which runs the job on its own thread."""
+        self._wake.set()
     
     def start(self) -> None:
-        """Start the scheduler loop."""
+        """Start the scheduler and block until stop() is called.
+
+        The job runs on the calling thread, so Ctrl-C interrupts it. If runs
+        were missed (host suspended, clock stepped forward), the job runs once
+        to catch up rather than once per missed day.
+        """
+        self.logger.info("Scheduler started. Waiting for scheduled time...")
+        
+        try:
+            while True:
+                self._arm()
+                self._wake.wait()
+                self._wake.clear()
+                if self._stop_event.is_set():
+                    break
+                if datetime.now() < self._next_run:
+                    continue  # Clock check or early wake-up, wait for the remainder
+                self._run_job()
+                self._next_run = self._compute_next(datetime.now())
+        finally:
+            # Also reached on KeyboardInterrupt; a pending timer would keep
+            # the process alive
+            self._stop_event.set()
+            self._cancel_timer()
+        
+        self.logger.info("Scheduler stopped")
+    
+    async def start_async(self) -> None:
+        """Start the scheduler loop on the running asyncio event loop."""
+        # _async_stop is set before _loop and cleared after it, so stop()
+        # never sees a loop without its event
+        self._async_stop = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
         self.logger.info("Scheduler started. Waiting for scheduled time...")
         
-        while not self._stop_flag:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
+        while not self._stop_event.is_set():
+            delay = (self._next_run - datetime.now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(
+                        self._async_stop.wait(),
+                        timeout=min(delay, self.CLOCK_CHECK_INTERVAL)
+                    )
+                    break
+                except asyncio.TimeoutError:
+                    pass
+            if datetime.now() < self._next_run:
+                continue  # Clock check or early wake-up, wait for the remainder
+            # Missed runs are caught up with a single run, as in _fire()
+            await self._run_job_async()
+            self._next_run = self._compute_next(datetime.now())
         
+        self._loop = None
+        self._async_stop = None
         self.logger.info("Scheduler stopped")
     
     def run_once(self) -> None:
@@ -64,7 +173,13 @@ class DailyScheduler:
     
     def stop(self) -> None:
         """Signal the scheduler to stop."""
-        self._stop_flag = True
+        self._stop_event.set()
+        self._cancel_timer()
+        self._wake.set()
+        loop, async_stop = self._loop, self._async_stop
+        if loop is not None and async_stop is not None:
+            # Safe to call from any thread, including the loop's own
+            loop.call_soon_threadsafe(async_stop.set)
         self.logger.info("Stop signal received")
     
     def get_next_run(self) -> Optional[str]:
@@ -74,7 +189,6 @@ class DailyScheduler:
         Returns:
             String representation of next run time, or None if not scheduled
         """
-        next_run = schedule.next_run()
-        if next_run:
-            return str(next_run)
+        if self._next_run:
+            return str(self._next_run)
         return None